@@ -6,4 +6,6 @@ from editor import Editor
 from git import Git
 from tesserae import Tesserae
 from tessera import Tessera
-from tesseraexceptions import TesseraError, ArgumentError, ConfigFileNotFoundError, ConfigSectionNotFoundError, ConfigOptionNotFoundError, TesseraNotFoundError, TesseraKeywordNotFoundError
+from relations import TesseraRelations
+from tesseraparser import TesseraParser, ParseDiagnostic
+from tesseraexceptions import TesseraError, ArgumentError, ConfigFileNotFoundError, ConfigSectionNotFoundError, ConfigOptionNotFoundError, TesseraNotFoundError, TesseraKeywordNotFoundError, TesseraParseError
@@ -51,10 +51,25 @@ class Git(object):
         """
         return self._gittle.commit(message="tessera updated: %s" % tessera.title, files=[os.path.relpath(tessera.tessera_file, self._gitpath), os.path.relpath(tessera.info_file, self._gitpath)])
 
-    def rm_tessera(self, tessera):
+    def add_attachment(self, tessera, blob_path, removed_blobs=()):
+        """
+            Commits an attachment blob and the attachments index of a Tessera to the repository.
+            The blobs in removed_blobs are removed in the same commit.
+        """
+        removed = [str(os.path.relpath(x, self._gitpath)) for x in removed_blobs]
+        if removed:
+            self._gittle.rm(removed)
+        return self._gittle.commit(message="tessera attachment added: %s" % tessera.title, files=[os.path.relpath(blob_path, self._gitpath), os.path.relpath(tessera.attachments_file, self._gitpath)] + removed)
+
+    def rm_tessera(self, tessera, attachments=False, removed_blobs=()):
         """
             Removes a tessera and commits to git repository.
+            The attachments index is removed as well if attachments is True
+            and the blobs in removed_blobs are removed in the same commit.
         """
         files = [str(os.path.relpath(tessera.tessera_file, self._gitpath)), str(os.path.relpath(tessera.info_file, self._gitpath))]
+        if attachments:
+            files.append(str(os.path.relpath(tessera.attachments_file, self._gitpath)))
+        files.extend(str(os.path.relpath(x, self._gitpath)) for x in removed_blobs)
         self._gittle.rm(files)
         return self._gittle.commit(message="tessera removed: %s" % tessera.title, files=files)
@@ -6,7 +6,7 @@ import os
 import sys
 
 from tesserae import Tesserae
-from tesseraexceptions import TesseraError
+from tesseraexceptions import TesseraError, ArgumentError
 
 pass_tesserae = click.make_pass_decorator(Tesserae)
 
@@ -70,30 +70,118 @@ def edit(tesserae, tessera_id):
         sys.stderr.write("Error: %s\n", str(e))
         return False
 
+@cli.command("set")
+@click.argument("tessera_id")
+@click.argument("keywords", nargs=-1, required=True)
+@pass_tesserae
+def set_keywords(tesserae, tessera_id, keywords):
+    """
+        Sets keywords of a tessera by it's id, e.g. status=done priority=3
+    """
+    try:
+        values = {}
+        for k in keywords:
+            if "=" not in k:
+                raise ArgumentError("invalid keyword assignment '%s'. Use keyword=value" % k)
+            keyword, value = k.split("=", 1)
+            values[keyword.strip()] = [x.strip() for x in value.split(",")]
+        return tesserae.set_keywords(tessera_id, values)
+    except TesseraError, e:
+        sys.stderr.write("Error: %s\n" % str(e))
+        return False
+
 @cli.command()
 @click.option("--order-by", type=str, default="priority", help="keyword to order by")
 @click.option("--order-type", type=click.Choice(["asc", "desc"]), default="asc", help="order type. Ascending or Descending")
 @click.option("--filter-types", type=str, help="filters for specific types")
+@click.option("--format", "output_format", type=click.Choice(Tesserae.OUTPUT_FORMATS), default="text", help="output format")
 @pass_tesserae
-def ls(tesserae, order_by, order_type, filter_types):
+def ls(tesserae, order_by, order_type, filter_types, output_format):
     """
         List all existing tesserae
     """
     try:
-        return tesserae.ls(order_by, order_type, set([x.strip() for x in filter_types.split(",")]) if filter_types else set())
+        return tesserae.ls(order_by, order_type, set([x.strip() for x in filter_types.split(",")]) if filter_types else set(), output_format)
     except TesseraError, e:
         sys.stderr.write("Error: %s\n" % str(e))
         return False
 
 @cli.command()
 @click.argument("tessera_id")
+@click.option("--format", "output_format", type=click.Choice(Tesserae.OUTPUT_FORMATS), default="text", help="output format")
 @pass_tesserae
-def show(tesserae, tessera_id):
+def show(tesserae, tessera_id, output_format):
     """
         Show a specific tessera
     """
     try:
-        return tesserae.show(tessera_id)
+        return tesserae.show(tessera_id, output_format)
+    except TesseraError, e:
+        sys.stderr.write("Error: %s\n" % str(e))
+        return False
+
+@cli.command()
+@click.argument("tessera_id")
+@pass_tesserae
+def deps(tesserae, tessera_id):
+    """
+        Show the dependency tree of a specific tessera
+    """
+    try:
+        return tesserae.deps(tessera_id)
+    except TesseraError, e:
+        sys.stderr.write("Error: %s\n" % str(e))
+        return False
+
+@cli.command()
+@click.option("--format", "output_format", type=click.Choice(Tesserae.OUTPUT_FORMATS), default="text", help="output format")
+@pass_tesserae
+def blocked(tesserae, output_format):
+    """
+        List all tesserae blocked by open dependencies
+    """
+    try:
+        return tesserae.blocked(output_format)
+    except TesseraError, e:
+        sys.stderr.write("Error: %s\n" % str(e))
+        return False
+
+@cli.command()
+@pass_tesserae
+def fsck(tesserae):
+    """
+        Validate all tesserae
+    """
+    try:
+        return tesserae.fsck()
+    except TesseraError, e:
+        sys.stderr.write("Error: %s\n" % str(e))
+        return False
+
+@cli.command()
+@click.argument("tessera_id")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@pass_tesserae
+def attach(tesserae, tessera_id, path):
+    """
+        Attaches a file to a specific tessera
+    """
+    try:
+        return tesserae.attach(tessera_id, path)
+    except TesseraError, e:
+        sys.stderr.write("Error: %s\n" % str(e))
+        return False
+
+@cli.command()
+@click.argument("tessera_id")
+@click.argument("name", required=False)
+@pass_tesserae
+def attachments(tesserae, tessera_id, name):
+    """
+        List the attachments of a specific tessera or write one of them to stdout
+    """
+    try:
+        return tesserae.attachments(tessera_id, name)
     except TesseraError, e:
         sys.stderr.write("Error: %s\n" % str(e))
         return False
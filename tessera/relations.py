@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+
+class TesseraRelations(object):
+    """
+        This class represents the relations graph between tesserae.
+        The adjacency index is built once from the relation keywords of all tesserae:
+            @depends-on <id>   this tessera depends on the tessera <id>
+            @blocks <id>       the tessera <id> depends on this tessera
+            @duplicates <id>   this tessera is a duplicate of the tessera <id>
+        Relation targets can be full or short tessera ids.
+        The reverse edges are computed while building the index.
+    """
+    def __init__(self, tesserae):
+        self._tesserae = dict((t.id, t) for t in tesserae)
+        self._ids = sorted(self._tesserae)
+        self._dependencies = {}
+        self._dependents = {}
+        self._duplicates = {}
+        self._duplicated_by = {}
+
+        for t in self._tesserae.values():
+            for target in t.keywords.get("depends-on", []):
+                self._add_edge(self._dependencies, self._dependents, t.id, self.resolve(target))
+            for target in t.keywords.get("blocks", []):
+                self._add_edge(self._dependencies, self._dependents, self.resolve(target), t.id)
+            for target in t.keywords.get("duplicates", []):
+                self._add_edge(self._duplicates, self._duplicated_by, t.id, self.resolve(target))
+
+    @property
+    def tesserae(self):
+        """
+            Returns all tesserae of the graph ordered by their id.
+        """
+        return [self._tesserae[x] for x in self._ids]
+
+    @staticmethod
+    def _add_edge(edges, reverse_edges, source, target):
+        """
+            Adds an edge and it's reverse edge to the index.
+        """
+        if not source or not target or source == target:
+            return
+        edges.setdefault(source, set()).add(target)
+        reverse_edges.setdefault(target, set()).add(source)
+
+    def resolve(self, target):
+        """
+            Returns the full tessera id of a full or short tessera id.
+            Unknown ids are returned as they are.
+        """
+        matches = [x for x in self._ids if x.startswith(target)]
+        return matches[0] if len(matches) == 1 else target
+
+    def get(self, tessera_id):
+        """
+            Returns the tessera with the given id or None if it does not exist.
+        """
+        return self._tesserae.get(tessera_id)
+
+    def dependencies(self, tessera_id):
+        """
+            Returns the ids of the tesserae the given tessera directly depends on.
+        """
+        return sorted(self._dependencies.get(tessera_id, []))
+
+    def dependents(self, tessera_id):
+        """
+            Returns the ids of the tesserae which directly depend on the given tessera.
+        """
+        return sorted(self._dependents.get(tessera_id, []))
+
+    def duplicates(self, tessera_id):
+        """
+            Returns the ids of the tesserae the given tessera duplicates or is duplicated by.
+        """
+        return sorted(self._duplicates.get(tessera_id, set()) | self._duplicated_by.get(tessera_id, set()))
+
+    def walk(self, tessera_id, skip=None):
+        """
+            Traverses the dependencies of the given tessera depth first.
+            Yields a tuple of (depth, tessera id, cycle) for every visited dependency.
+            cycle is True if the dependency is already on the current path, which
+            means it is not expanded again. Dependencies reachable by multiple paths
+            are only expanded once.
+            Dependencies for which the optional skip predicate returns True are
+            neither yielded nor expanded.
+        """
+        path = set([tessera_id])
+        expanded = set([tessera_id])
+        stack = [(1, iter(self.dependencies(tessera_id)), tessera_id)]
+        while stack:
+            depth, children, parent = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                path.discard(parent)
+                continue
+
+            if skip is not None and skip(child):
+                continue
+
+            if child in path:
+                yield depth, child, True
+                continue
+
+            yield depth, child, False
+            if child not in expanded:
+                expanded.add(child)
+                path.add(child)
+                stack.append((depth + 1, iter(self.dependencies(child)), child))
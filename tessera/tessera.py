@@ -2,11 +2,13 @@
 
 import os
 import shutil
+import hashlib
 from datetime import datetime
 from dulwich.config import StackedConfig
 from uuid import uuid1 as generate_uniq_id
 
-from tesseraexceptions import TesseraKeywordNotFoundError
+from tesseraparser import TesseraParser
+from tesseraexceptions import TesseraError, ArgumentError, TesseraKeywordNotFoundError, TesseraParseError
 
 
 class Tessera(object):
@@ -14,8 +16,10 @@ class Tessera(object):
 
     TESSERA_FILENAME = "tessera"
     INFO_FILENAME = "info"
+    ATTACHMENTS_FILENAME = "attachments"
 
-    KEYWORDS = ["status", "type", "priority", "tags"]
+    RELATION_KEYWORDS = ["depends-on", "blocks", "duplicates"]
+    KEYWORDS = ["status", "type", "priority", "tags"] + RELATION_KEYWORDS
 
     @classmethod
     def create(cls, basepath, title):
@@ -42,12 +46,13 @@ class Tessera(object):
         t = Tessera(t_id, t_path)
         return t
 
-    def __init__(self, tessera_id, tessera_path):
+    def __init__(self, tessera_id, tessera_path, strict=True):
         self._id = tessera_id
         self._short_id = tessera_id.split("-", 1)[0]
         self._path = tessera_path
         self._tessera_file = os.path.join(tessera_path, Tessera.TESSERA_FILENAME)
         self._info_file = os.path.join(tessera_path, Tessera.INFO_FILENAME)
+        self._attachments_file = os.path.join(tessera_path, Tessera.ATTACHMENTS_FILENAME)
 
         self._title = None
         self._description = ""
@@ -56,10 +61,15 @@ class Tessera(object):
 
         self._raw_tessera_file_content = ""
         self._raw_info_file_content = ""
+        self._tessera_diagnostics = []
+        self._info_diagnostics = []
 
         self._parse_tessera_file()
         self._parse_info_file()
 
+        if strict and self.diagnostics:
+            raise TesseraParseError(self.diagnostics)
+
     @property
     def id(self):
         """
@@ -124,6 +134,13 @@ class Tessera(object):
         """
         return self._info_file
 
+    @property
+    def attachments_file(self):
+        """
+            Returns the tessera's attachments index file path.
+        """
+        return self._attachments_file
+
     @property
     def raw_tessera_file_content(self):
         """
@@ -138,36 +155,188 @@ class Tessera(object):
         """
         return self._raw_info_file_content
 
+    @property
+    def diagnostics(self):
+        """
+            Returns the problems found while parsing the tessera.
+        """
+        return self._tessera_diagnostics + self._info_diagnostics
+
+    def as_dict(self):
+        """
+            Returns the parsed fields of this tessera as a dictionary.
+        """
+        return {
+            "id": self._id,
+            "short_id": self._short_id,
+            "title": self._title,
+            "keywords": self._keywords,
+            "metadata": self._metadata,
+            "description": self._description
+        }
+
+    def checksum(self):
+        """
+            Returns the sha1 checksum of the tessera file as it is on disk.
+        """
+        with open(self._tessera_file, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def set_keywords(self, keywords):
+        """
+            Sets the given keywords in the tessera file.
+            The last existing line of a keyword is replaced in place and earlier
+            duplicates are dropped, commented keyword lines are activated and all
+            other keywords are added after the last keyword line.
+            The file is restored if a touched line does not parse or the keywords
+            do not parse to the given values.
+            Returns True if the tessera file has changed.
+        """
+        for keyword, values in keywords.items():
+            if keyword not in Tessera.KEYWORDS:
+                raise TesseraKeywordNotFoundError(keyword, Tessera.KEYWORDS)
+            if not values or not all(values):
+                raise ArgumentError("missing value for keyword '%s'" % keyword)
+
+        original = self._raw_tessera_file_content
+        lines = original.splitlines()
+
+        # collect the active and commented keyword lines, the title line is skipped
+        active = {}
+        commented = {}
+        last = 0
+        for n, l in enumerate(lines[1:], 1):
+            l = l.strip()
+            is_comment = l.startswith("//")
+            if is_comment:
+                l = l[2:].strip()
+            if not l.startswith("@"):
+                continue
+
+            parts = l[1:].split(None, 1)
+            if parts:
+                (commented if is_comment else active).setdefault(parts[0], []).append(n)
+            last = n
+
+        # the parser keeps the last occurrence of a keyword, thus the last active
+        # line is rewritten and all earlier ones are dropped
+        replacements = {}
+        dropped = set()
+        appended = []
+        for keyword in Tessera.KEYWORDS:
+            if keyword not in keywords:
+                continue
+            line = "@%s %s" % (keyword, ", ".join(keywords[keyword]))
+            if keyword in active:
+                replacements[active[keyword][-1]] = line
+                dropped.update(active[keyword][:-1])
+            elif keyword in commented:
+                replacements[commented[keyword][0]] = line
+            else:
+                appended.append(line)
+
+        result = []
+        touched = set()
+        for n, l in enumerate(lines):
+            if n in dropped:
+                continue
+            if n in replacements:
+                touched.add(len(result) + 1)
+            result.append(replacements.get(n, l))
+            if n == last:
+                touched.update(range(len(result) + 1, len(result) + len(appended) + 1))
+                result.extend(appended)
+                appended = []
+        touched.update(range(len(result) + 1, len(result) + len(appended) + 1))
+        result.extend(appended)
+
+        content = "".join(l + "\n" for l in result)
+        if content == original:
+            return False
+
+        with open(self._tessera_file, "w") as f:
+            f.write(content)
+        self._parse_tessera_file()
+
+        def restore():
+            with open(self._tessera_file, "w") as f:
+                f.write(original)
+            self._parse_tessera_file()
+
+        # problems on lines which were not touched are left for the user to fix
+        problems = [d for d in self._tessera_diagnostics if d.line in touched]
+        if problems:
+            restore()
+            raise TesseraParseError(problems)
+
+        for keyword, values in keywords.items():
+            if self._keywords.get(keyword) != [x.strip() for x in ", ".join(values).split(",")]:
+                restore()
+                raise TesseraError("cannot set keyword '%s' of tessera with id '%s'" % (keyword, self._id))
+        return True
+
+    def get_attachments(self):
+        """
+            Returns the attachments of this tessera as a list of (name, blob id) tuples.
+            The attachments index is only read when this method is called.
+        """
+        return Tessera.read_attachments(self._attachments_file)
+
+    @staticmethod
+    def read_attachments(path):
+        """
+            Reads an attachments index file and returns a list of (name, blob id) tuples.
+        """
+        if not os.path.exists(path):
+            return []
+
+        attachments = []
+        with open(path, "r") as f:
+            for l in f.read().splitlines():
+                if l.strip():
+                    blob_id, name = l.split(" ", 1)
+                    attachments.append((name, blob_id))
+        return attachments
+
+    def add_attachment(self, name, blob_id):
+        """
+            References the blob with the given id as attachment with the given name.
+            An existing attachment with the same name is replaced.
+            Returns False if the attachment was already referenced.
+        """
+        attachments = self.get_attachments()
+        if (name, blob_id) in attachments:
+            return False
+
+        attachments = [(n, b) for n, b in attachments if n != name] + [(name, blob_id)]
+        with open(self._attachments_file, "w") as f:
+            for n, b in attachments:
+                f.write("%s %s\n" % (b, n))
+        return True
+
+    def reload(self):
+        """
+            Parses the tessera and info files again.
+            The diagnostics of the previous parse are replaced.
+        """
+        self._parse_tessera_file()
+        self._parse_info_file()
+
     def _parse_tessera_file(self):
         """
             Parses the tessera file.
         """
-        with open(self._tessera_file, "r") as f:
-            for n, l in enumerate(f.read().splitlines()):
-                self._raw_tessera_file_content += l + "\n"
-                l = l.strip()
-                if l.startswith("//"):  # line is a comment
-                    continue
-
-                if n == 0:  # title must be on first line
-                    self._title = l.replace("#", "").strip()
-                if l.startswith("@"):  # line contains a keyword
-                    keyword, values = l[1:].split(" ", 1)
-                    if keyword not in Tessera.KEYWORDS:
-                        raise TesseraKeywordNotFoundError(keyword, Tessera.KEYWORDS)
-                    self._keywords[keyword] = [x.strip() for x in values.split(",")]
-                else:
-                    self._description += l + "\n"
+        parser = TesseraParser()
+        self._title, self._description, self._keywords, self._raw_tessera_file_content = parser.parse_tessera(self._tessera_file, Tessera.KEYWORDS)
+        self._tessera_diagnostics = parser.diagnostics
 
     def _parse_info_file(self):
         """
             Parses the info file.
         """
-        with open(self._info_file, "r") as f:
-            for l in f.read().splitlines():
-                self._raw_info_file_content += l + "\n"
-                key, value = l.split(":", 1)
-                self._metadata[key.strip()] = value.strip()
+        parser = TesseraParser()
+        self._metadata, self._raw_info_file_content = parser.parse_info(self._info_file)
+        self._info_diagnostics = parser.diagnostics
 
     def _write_info_file(self):
         """
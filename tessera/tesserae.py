@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
 
 import os
-from shutil import copyfile
+import sys
+import csv
+import json
+import hashlib
+from shutil import copyfile, copyfileobj
 from gittle import Gittle
 from glob import glob
+from multiprocessing import Pool, cpu_count
 
 from git import Git
 from tessera import Tessera
-from tesseraexceptions import TesseraError, NoTesseraRepoError, TesseraNotFoundError
+from relations import TesseraRelations
+from tesseraexceptions import TesseraError, NoTesseraRepoError, TesseraNotFoundError, TesseraParseError
 from config import TesseraConfig
 from editor import Editor
 
@@ -34,16 +40,55 @@ def check_tessera_id(func):
     return _wrapper
 
 
+def check_tessera(args):
+    """
+        Parses a single tessera and returns it's diagnostics as strings.
+        This is a module level function to be usable by a multiprocessing pool.
+    """
+    tessera_id, path = args
+    return [str(d) for d in Tessera(tessera_id, path, strict=False).diagnostics]
+
+
+def get_blob_id(path):
+    """
+        Returns the git blob id of the file at the given path.
+        The file is read in chunks and never loaded as a whole.
+    """
+    h = hashlib.sha1("blob %d\0" % os.path.getsize(path))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def check_blob(args):
+    """
+        Verifies that the content of a stored attachment blob matches it's blob id.
+        This is a module level function to be usable by a multiprocessing pool.
+    """
+    blob_id, path = args
+    actual = get_blob_id(path)
+    if actual != blob_id:
+        return ["%s: content does not match blob id, actual blob id is '%s'" % (path, actual)]
+    return []
+
+
 class Tesserae(object):
     CONFIG_TEMPLATE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates/config")
     ROOT_DIRECTORY = ".tesserae"
+    ATTACHMENTS_DIRECTORY = "attachments"
 
     LS_HEADER = ("Id", "Title", "Status", "Type", "Priority", "Author", "Last updated")
 
+    OUTPUT_FORMATS = ("text", "json", "jsonl", "csv", "tsv")
+    STRUCTURED_METADATA = ("author", "email", "updated")
+    CLOSED_STATUS = ("done", "obsolete")
+
     def __init__(self, path):
         self._git = Git(path)
         self._path = path
         self._configpath = os.path.join(self.tesseraepath, "config")
+        self._relations = None
 
     @property
     def path(self):
@@ -57,6 +102,10 @@ class Tesserae(object):
     def configpath(self):
         return self._configpath
 
+    @property
+    def attachmentspath(self):
+        return os.path.join(self.tesseraepath, Tesserae.ATTACHMENTS_DIRECTORY)
+
     def _is_tesserae_repo(self):
         """
             Checks whether the path is a tesserae repository or not.
@@ -72,23 +121,153 @@ class Tesserae(object):
             This method evaluates the full tessera id of a short tessera id.
         """
         try:
-            return os.path.basename(glob(os.path.join(self.tesseraepath, tessera_id + "*"))[0])
+            return [x for x in map(os.path.basename, glob(os.path.join(self.tesseraepath, tessera_id + "*"))) if x != Tesserae.ATTACHMENTS_DIRECTORY][0]
         except IndexError:
             raise TesseraNotFoundError(tessera_id)
 
-    def _get_all_tesserae(self):
+    def _get_tessera_paths(self):
         """
-            Returns all tesserae.
+            Returns the id and path of all tessera directories.
         """
-        tesserae = []
+        paths = []
         for tessera_id in os.listdir(self.tesseraepath):
             path = os.path.join(self.tesseraepath, tessera_id)
-            if not os.path.isdir(path):
-                continue
+            if os.path.isdir(path) and tessera_id != Tesserae.ATTACHMENTS_DIRECTORY:
+                paths.append((tessera_id, path))
+        return paths
 
-            tesserae.append(Tessera(tessera_id, path))
+    def _get_all_tesserae(self):
+        """
+            Returns all tesserae.
+            Tesserae which cannot be parsed are skipped with a warning.
+        """
+        tesserae = []
+        for tessera_id, path in self._get_tessera_paths():
+            try:
+                tesserae.append(Tessera(tessera_id, path))
+            except TesseraParseError, e:
+                sys.stderr.write("Warning: skipping tessera '%s': %s\n" % (tessera_id, str(e.diagnostics[0])))
         return tesserae
 
+    def _store_blob(self, path):
+        """
+            Stores the file at the given path in the attachments directory.
+            The file is addressed by it's git blob id, thus identical files are stored once.
+            Returns the blob id and the path of the stored blob.
+        """
+        blob_id = get_blob_id(path)
+
+        blob_path = os.path.join(self.attachmentspath, blob_id)
+        if not os.path.exists(blob_path):
+            if not os.path.isdir(self.attachmentspath):
+                os.makedirs(self.attachmentspath)
+            tmp_path = blob_path + ".tmp"
+            with open(path, "rb") as fin:
+                with open(tmp_path, "wb") as fout:
+                    copyfileobj(fin, fout)
+            os.rename(tmp_path, blob_path)
+        return blob_id, blob_path
+
+    def _get_referenced_blobs(self):
+        """
+            Returns the ids of all blobs referenced by any tessera.
+            Only the attachments index files are read, the tesserae are not parsed.
+        """
+        blobs = set()
+        for _, path in self._get_tessera_paths():
+            blobs.update(b for _, b in Tessera.read_attachments(os.path.join(path, Tessera.ATTACHMENTS_FILENAME)))
+        return blobs
+
+    def _release_blobs(self, blob_ids):
+        """
+            Deletes the given blobs if they are no longer referenced by any tessera.
+            Returns the paths of the deleted blobs.
+        """
+        referenced = self._get_referenced_blobs()
+        removed = []
+        for blob_id in set(blob_ids) - referenced:
+            blob_path = os.path.join(self.attachmentspath, blob_id)
+            if os.path.isfile(blob_path):
+                os.remove(blob_path)
+                removed.append(blob_path)
+        return removed
+
+    def _get_blob_path(self, blob_id):
+        """
+            Returns the path of a stored attachment blob.
+            Throws an exception if the blob is missing.
+        """
+        blob_path = os.path.join(self.attachmentspath, blob_id)
+        if not os.path.isfile(blob_path):
+            raise TesseraError("attachment blob '%s' is missing" % blob_id)
+        return blob_path
+
+    def _get_relations(self):
+        """
+            Returns the relations graph of all tesserae.
+            The graph is built once and cached for the lifetime of this object.
+        """
+        if self._relations is None:
+            self._relations = TesseraRelations(self._get_all_tesserae())
+        return self._relations
+
+    def _is_closed(self, tessera):
+        """
+            Checks whether the tessera has a closed status.
+        """
+        return tessera is not None and any(x in Tesserae.CLOSED_STATUS for x in tessera.keywords.get("status", []))
+
+    def _print_table(self, header, rows):
+        """
+            Prints the rows as a table with the given header.
+        """
+        rows = [header] + rows
+        widths = [max(map(len, column)) for column in zip(*rows)]
+        for n, r in enumerate(rows):
+            print("  ".join(data.ljust(width) for data, width in zip(r, widths)))
+            if n == 0:
+                print("=" * (sum(widths) + 2 * len(widths)))
+
+    def _write_structured(self, tesserae, output_format, extra_fields=()):
+        """
+            Writes the given tesserae to stdout in a machine-readable format.
+            The tesserae are written one by one as they are consumed from the given iterable.
+            If extra_fields are given the iterable yields tuples of a tessera and a
+            dictionary with a value for each of these fields.
+        """
+        def records():
+            for item in tesserae:
+                if extra_fields:
+                    yield item
+                else:
+                    yield item, {}
+
+        out = sys.stdout
+        if output_format in ("json", "jsonl"):
+            if output_format == "json":
+                out.write("[")
+            for n, (t, extra) in enumerate(records()):
+                data = t.as_dict()
+                data.update(extra)
+                if output_format == "jsonl":
+                    out.write(json.dumps(data, sort_keys=True) + "\n")
+                else:
+                    out.write(("," if n else "") + "\n" + json.dumps(data, sort_keys=True))
+            if output_format == "json":
+                out.write("\n]\n")
+        elif output_format in ("csv", "tsv"):
+            writer = csv.writer(out, delimiter="," if output_format == "csv" else "\t", lineterminator="\n")
+            writer.writerow(["id", "title"] + Tessera.KEYWORDS + list(Tesserae.STRUCTURED_METADATA) + ["description"] + list(extra_fields))
+            for t, extra in records():
+                writer.writerow([t.id, t.title] +
+                                [", ".join(t.keywords.get(k, [])) for k in Tessera.KEYWORDS] +
+                                [t.metadata.get(k, "") for k in Tesserae.STRUCTURED_METADATA] +
+                                [t.description] +
+                                [", ".join(extra[k]) if isinstance(extra[k], list) else str(extra[k]) for k in extra_fields])
+        else:
+            raise TesseraError("unknown output format '%s'. Available formats are: '%s'" % (output_format, Tesserae.OUTPUT_FORMATS))
+        out.flush()
+
     def init(self):
         """
             Initialize empty git tesserae repository inside git repository.
@@ -112,29 +291,33 @@ class Tesserae(object):
 
     @verify_tessera_path
     @check_tessera_id
-    def show(self, tessera_id):
+    def show(self, tessera_id, output_format="text"):
         """
             Shows a specific tessera by passing the tessera_id parameter.
         """
         t = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id))
+        if output_format != "text":
+            self._write_structured([t], output_format)
+            return True
+
         print(t.raw_tessera_file_content)
         return True
 
     @verify_tessera_path
-    def ls(self, order_by, order_type, filter_types):
+    def ls(self, order_by, order_type, filter_types, output_format="text"):
         """
             Lists all tesserae and show basic information.
         """
         tesserae = self._get_all_tesserae()
 
-        if not tesserae:
+        if not tesserae and output_format == "text":
             print("no tesserae created yet. Use git tessera create 'title' to create a new tessera")
             return True
 
-        rows = [(t.short_id, t.title, ", ".join(t.keywords.get("status", ["unknown"])), ", ".join(t.keywords.get("type", ["unknown"])), t.keywords.get("priority", ["0"])[0], t.metadata.get("author", ["unknown"]), t.metadata.get("updated"))
+        rows = [((t.short_id, t.title, ", ".join(t.keywords.get("status", ["unknown"])), ", ".join(t.keywords.get("type", ["unknown"])), t.keywords.get("priority", ["0"])[0], t.metadata.get("author", ["unknown"]), t.metadata.get("updated")), t)
                 for t in tesserae if not filter_types or filter_types.intersection(t.keywords.get("type"))]
 
-        if not rows:
+        if not rows and output_format == "text":
             print("no tesserae found which matched your query")
             return True
 
@@ -146,16 +329,122 @@ class Tesserae(object):
             except ValueError:
                 raise TesseraError("cannot order by '%s' because this columns does not exist. Available colums are: '%s'" % (order_by, headers))
 
-            rows = sorted(rows, key=lambda r: float(r[index]) if r[index].isdigit() else r[index], reverse=order_type == "desc")
+            rows = sorted(rows, key=lambda r: float(r[0][index]) if r[0][index].isdigit() else r[0][index], reverse=order_type == "desc")
 
-        rows.insert(0, Tesserae.LS_HEADER)
-        widths = [max(map(len, column)) for column in zip(*rows)]
-        for n, r in enumerate(rows):
-            print("  ".join(data.ljust(width) for data, width in zip(r, widths)))
-            if n == 0:
-                print("=" * (sum(widths) + 2 * len(widths)))
+        if output_format != "text":
+            self._write_structured((t for _, t in rows), output_format)
+            return True
+
+        self._print_table(Tesserae.LS_HEADER, [r for r, _ in rows])
+        return True
+
+    @verify_tessera_path
+    @check_tessera_id
+    def deps(self, tessera_id):
+        """
+            Shows the dependency tree of a tessera by it's id.
+        """
+        relations = self._get_relations()
+        tessera = relations.get(tessera_id)
+        if tessera is None:
+            # the tessera was skipped while building the graph, parse it
+            # strictly to report why
+            tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id))
+        print("%s  %s" % (tessera.short_id, tessera.title))
+
+        for depth, dep_id, cycle in relations.walk(tessera_id):
+            dep = relations.get(dep_id)
+            line = "%s%s  %s" % ("  " * depth, dep.short_id if dep else dep_id, dep.title if dep else "(unknown tessera)")
+            if dep and self._is_closed(dep):
+                line += "  [%s]" % ", ".join(dep.keywords.get("status"))
+            if cycle:
+                line += "  (cycle)"
+            print(line)
+
+        dependents = [t for t in map(relations.get, relations.dependents(tessera_id)) if t]
+        if dependents:
+            print("blocks: %s" % ", ".join(t.short_id for t in dependents))
+        duplicates = [t for t in map(relations.get, relations.duplicates(tessera_id)) if t]
+        if duplicates:
+            print("duplicates: %s" % ", ".join(t.short_id for t in duplicates))
         return True
 
+    def _get_blocked(self):
+        """
+            Yields every open tessera which depends on at least one open tessera
+            together with the ids of the blocking tesserae and whether a cycle was found.
+            Closed dependencies are not traversed.
+        """
+        relations = self._get_relations()
+        for t in relations.tesserae:
+            if self._is_closed(t):
+                continue
+
+            blockers = []
+            cycle = False
+            for _, dep_id, is_cycle in relations.walk(t.id, skip=lambda x: self._is_closed(relations.get(x))):
+                cycle = cycle or is_cycle
+                if relations.get(dep_id) and dep_id != t.id and dep_id not in blockers:
+                    blockers.append(dep_id)
+
+            if blockers:
+                yield t, blockers, cycle
+
+    @verify_tessera_path
+    def blocked(self, output_format="text"):
+        """
+            Lists all open tesserae which depend on at least one open tessera.
+        """
+        if output_format != "text":
+            self._write_structured(((t, {"blocked_by": blockers, "cycle": cycle}) for t, blockers, cycle in self._get_blocked()), output_format, ("blocked_by", "cycle"))
+            return True
+
+        relations = self._get_relations()
+        rows = [(t.short_id, t.title, ", ".join(relations.get(x).short_id for x in blockers) + (" (cycle)" if cycle else ""))
+                for t, blockers, cycle in self._get_blocked()]
+
+        if not rows:
+            print("no blocked tesserae found")
+            return True
+
+        self._print_table(("Id", "Title", "Blocked by"), rows)
+        return True
+
+    @verify_tessera_path
+    def fsck(self):
+        """
+            Validates all tesserae and attachment blobs in parallel and reports every problem found.
+        """
+        paths = self._get_tessera_paths()
+        blobs = []
+        if os.path.isdir(self.attachmentspath):
+            blobs = [(x, os.path.join(self.attachmentspath, x)) for x in os.listdir(self.attachmentspath)]
+
+        pool = Pool(min(cpu_count(), max(len(paths) + len(blobs), 1)))
+        try:
+            results = pool.map(check_tessera, paths, chunksize=64)
+            results.extend(pool.map(check_blob, blobs, chunksize=8))
+        finally:
+            pool.close()
+            pool.join()
+
+        stored = set(x for x, _ in blobs)
+        for tessera_id, path in paths:
+            for name, blob_id in Tessera.read_attachments(os.path.join(path, Tessera.ATTACHMENTS_FILENAME)):
+                if blob_id not in stored:
+                    results.append(["%s: attachment '%s' references missing blob '%s'" % (os.path.join(path, Tessera.ATTACHMENTS_FILENAME), name, blob_id)])
+        for blob_id in stored - self._get_referenced_blobs():
+            results.append(["%s: blob is not referenced by any tessera" % os.path.join(self.attachmentspath, blob_id)])
+
+        errors = 0
+        for diagnostics in results:
+            for d in diagnostics:
+                print(d)
+            errors += len(diagnostics)
+
+        print("checked %d tesserae and %d attachment blobs, found %d problems" % (len(paths), len(blobs), errors))
+        return not errors
+
     @verify_tessera_path
     def create(self, title):
         """
@@ -181,10 +470,12 @@ class Tesserae(object):
         """
             Removes a tessera by it's id.
         """
-        tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id))
+        tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id), strict=False)
+        attachments = tessera.get_attachments()
         tessera.remove()
+        removed_blobs = self._release_blobs(b for _, b in attachments)
 
-        if not self._git.rm_tessera(tessera):
+        if not self._git.rm_tessera(tessera, bool(attachments), removed_blobs):
             print("error: cannot remove tessera")
             return False
 
@@ -197,12 +488,42 @@ class Tesserae(object):
         """
             Edits a tessera by it's id.
         """
-        tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id))
+        tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id), strict=False)
+        checksum = tessera.checksum()
 
         if not Editor.open(tessera.tessera_file, TesseraConfig(self._configpath)):
             print("error: cannot updated tessera")
             return False
 
+        if tessera.checksum() == checksum:
+            print("Tessera with id %s not changed" % tessera.id)
+            return True
+
+        tessera.reload()
+        for d in tessera.diagnostics:
+            sys.stderr.write("Warning: %s\n" % str(d))
+
+        tessera.update()
+
+        if not self._git.update_tessera(tessera):
+            print("error: cannot commit updated tessera")
+            return False
+
+        print("Updated tessera with id %s" % tessera.id)
+        return True
+
+    @verify_tessera_path
+    @check_tessera_id
+    def set_keywords(self, tessera_id, keywords):
+        """
+            Sets keywords of a tessera by it's id without opening an editor.
+        """
+        tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id), strict=False)
+
+        if not tessera.set_keywords(keywords):
+            print("Tessera with id %s not changed" % tessera.id)
+            return True
+
         tessera.update()
 
         if not self._git.update_tessera(tessera):
@@ -211,3 +532,53 @@ class Tesserae(object):
 
         print("Updated tessera with id %s" % tessera.id)
         return True
+
+    @verify_tessera_path
+    @check_tessera_id
+    def attach(self, tessera_id, path):
+        """
+            Attaches a file to a tessera by it's id.
+        """
+        if not os.path.isfile(path):
+            raise TesseraError("cannot attach '%s' because it is not a file" % path)
+
+        tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id), strict=False)
+        blob_id, blob_path = self._store_blob(path)
+        replaced = [b for n, b in tessera.get_attachments() if n == os.path.basename(path) and b != blob_id]
+
+        if not tessera.add_attachment(os.path.basename(path), blob_id):
+            print("File '%s' is already attached to tessera with id %s" % (os.path.basename(path), tessera.id))
+            return True
+
+        if not self._git.add_attachment(tessera, blob_path, self._release_blobs(replaced)):
+            print("error: cannot commit attachment")
+            return False
+
+        print("Attached '%s' to tessera with id %s" % (os.path.basename(path), tessera.id))
+        return True
+
+    @verify_tessera_path
+    @check_tessera_id
+    def attachments(self, tessera_id, name=None):
+        """
+            Lists the attachments of a tessera by it's id.
+            If a name is given the content of this attachment is written to stdout.
+        """
+        tessera = Tessera(tessera_id, os.path.join(self.tesseraepath, tessera_id), strict=False)
+        attachments = tessera.get_attachments()
+
+        if name is None:
+            if not attachments:
+                print("no attachments for tessera with id %s" % tessera.id)
+                return True
+            self._print_table(("Name", "Blob", "Size"), [(n, b, str(os.path.getsize(self._get_blob_path(b)))) for n, b in attachments])
+            return True
+
+        for n, blob_id in attachments:
+            if n == name:
+                with open(self._get_blob_path(blob_id), "rb") as f:
+                    copyfileobj(f, sys.stdout)
+                sys.stdout.flush()
+                return True
+
+        raise TesseraError("tessera with id '%s' has no attachment '%s'" % (tessera.id, name))
@@ -37,3 +37,9 @@ class TesseraNotFoundError(TesseraError):
 class TesseraKeywordNotFoundError(TesseraError):
     def __init__(self, keyword, keywords):
         TesseraError.__init__(self, "tessera keyword '%s' does not exist. Use one keyword from '%s'" % (keyword, keywords))
+
+
+class TesseraParseError(TesseraError):
+    def __init__(self, diagnostics):
+        TesseraError.__init__(self, "\n".join(str(d) for d in diagnostics))
+        self.diagnostics = diagnostics
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+
+class ParseDiagnostic(object):
+    """
+        This class represents a problem found while parsing a tessera file.
+        Lines and columns start at 1. A line of 0 refers to the whole file.
+    """
+    def __init__(self, path, line, column, message):
+        self.path = path
+        self.line = line
+        self.column = column
+        self.message = message
+
+    def __str__(self):
+        return "%s:%d:%d: %s" % (self.path, self.line, self.column, self.message)
+
+
+class Token(object):
+    """
+        This class represents a single token of a tessera file.
+    """
+    TITLE = "title"
+    KEYWORD = "keyword"
+    VALUE = "value"
+    COMMENT = "comment"
+    TEXT = "text"
+
+    __slots__ = ("kind", "line", "column", "value")
+
+    def __init__(self, kind, line, column, value):
+        self.kind = kind
+        self.line = line
+        self.column = column
+        self.value = value
+
+
+class TesseraParser(object):
+    """
+        This class parses the tessera and info files of a tessera.
+        Every file is read once and processed in a single pass.
+        Problems do not abort the parsing, they are collected as diagnostics
+        and the affected lines are skipped.
+    """
+    def __init__(self):
+        self._diagnostics = []
+
+    @property
+    def diagnostics(self):
+        """
+            Returns the diagnostics collected by this parser.
+        """
+        return self._diagnostics
+
+    def _error(self, path, line, column, message):
+        self._diagnostics.append(ParseDiagnostic(path, line, column, message))
+
+    def _read(self, path):
+        """
+            Returns the content of the file or None if it cannot be read.
+        """
+        try:
+            with open(path, "r") as f:
+                return f.read()
+        except IOError as e:
+            self._error(path, 0, 0, "cannot read file: %s" % e.strerror)
+            return None
+
+    @staticmethod
+    def tokenize(content):
+        """
+            Splits the content of a tessera file into tokens.
+            A keyword line yields a KEYWORD token followed by a VALUE token
+            whose value is an empty string if the keyword has no value.
+        """
+        for n, raw in enumerate(content.splitlines(), 1):
+            l = raw.strip()
+            column = len(raw) - len(raw.lstrip()) + 1
+            if l.startswith("//"):
+                yield Token(Token.COMMENT, n, column, l[2:].strip())
+            elif n == 1:
+                yield Token(Token.TITLE, n, column, l.lstrip("#").strip())
+            elif l.startswith("@"):
+                parts = l[1:].split(None, 1)
+                keyword = parts[0] if parts else ""
+                yield Token(Token.KEYWORD, n, column + 1, keyword)
+                if len(parts) > 1:
+                    yield Token(Token.VALUE, n, column + l.index(parts[1], len(keyword) + 1), parts[1])
+                else:
+                    yield Token(Token.VALUE, n, column + len(l), "")
+            else:
+                yield Token(Token.TEXT, n, column, l)
+
+    def parse_tessera(self, path, known_keywords):
+        """
+            Parses a tessera file.
+            Returns a tuple of the title, description, keywords and the raw content.
+        """
+        title = None
+        description = ""
+        keywords = {}
+
+        content = self._read(path)
+        if content is None:
+            return title, description, keywords, ""
+
+        keyword = None
+        for token in TesseraParser.tokenize(content):
+            if token.kind == Token.TITLE:
+                title = token.value
+                if not title:
+                    self._error(path, token.line, token.column, "missing title")
+            elif token.kind == Token.KEYWORD:
+                keyword = token.value
+                if not keyword:
+                    self._error(path, token.line, token.column, "missing keyword name")
+                    keyword = None
+                elif keyword not in known_keywords:
+                    self._error(path, token.line, token.column, "tessera keyword '%s' does not exist. Use one keyword from '%s'" % (keyword, known_keywords))
+                    keyword = None
+            elif token.kind == Token.VALUE:
+                if keyword is None:
+                    continue
+                if not token.value:
+                    self._error(path, token.line, token.column, "missing value for keyword '%s'" % keyword)
+                else:
+                    keywords[keyword] = [x.strip() for x in token.value.split(",")]
+                keyword = None
+            elif token.kind == Token.TEXT:
+                description += token.value + "\n"
+
+        if title is None:
+            self._error(path, 1, 1, "missing title")
+
+        return title, description, keywords, "".join(l + "\n" for l in content.splitlines())
+
+    def parse_info(self, path):
+        """
+            Parses an info file.
+            Returns a tuple of the metadata and the raw content.
+        """
+        metadata = {}
+
+        content = self._read(path)
+        if content is None:
+            return metadata, ""
+
+        for n, raw in enumerate(content.splitlines(), 1):
+            if not raw.strip():
+                continue
+
+            column = len(raw) - len(raw.lstrip()) + 1
+            if ":" not in raw:
+                self._error(path, n, column, "expected 'key: value'")
+                continue
+
+            key, value = raw.split(":", 1)
+            if not key.strip():
+                self._error(path, n, column, "missing key")
+                continue
+            metadata[key.strip()] = value.strip()
+
+        return metadata, "".join(l + "\n" for l in content.splitlines())